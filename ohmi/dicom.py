@@ -10,41 +10,40 @@ Copyright (c) 2025, Tommy Löfstedt. All rights reserved.
 @email:   tommy.lofstedt@umu.se
 @license: BSD 3-clause.
 """
-# import os
+import os
 import sys
 import abc
 # import glob
 import typing
 import pathlib
 import warnings
-
-import tkinter as tk
-from tkinter import ttk
+import concurrent.futures
 
 import pydicom
 import numpy as np
-import matplotlib.pyplot as plt
 
 import tree
 import utils
 import image
 import errors
+import kernels
 
 # print(__doc__)
 
 
-if len(sys.argv) != 2:
-    path = "/home/tommy/data/Data/Federated_Learning_Test_Sample/" + \
-        "0a3b871660/CT/209768/"
-    file = "CT 1.3.6.1.4.1.30071.8.4931001581895.7876809425404177307828748" + \
-        "15224.dcm"
-else:
-    path = sys.argv[1]
-    file = sys.argv[2]
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        path = "/home/tommy/data/Data/Federated_Learning_Test_Sample/" + \
+            "0a3b871660/CT/209768/"
+        file = "CT 1.3.6.1.4.1.30071.8.49310015818" + \
+            "95.787680942540417730782874815224.dcm"
+    else:
+        path = sys.argv[1]
+        file = sys.argv[2]
 
-path = pathlib.Path(path).resolve(strict=True)
+    path = pathlib.Path(path).resolve(strict=True)
 
-assert path.is_dir()
+    assert path.is_dir()
 
 
 # files = list(path.glob("*.dcm"))
@@ -95,58 +94,132 @@ def build_tree(
                parent: tree.Node,
                ds: pydicom.dataset.Dataset,
                # parent: typing.Union[dict, None] = None,
+               max_depth: typing.Union[int, None] = None,
                ) -> tree.Node:
     """Build a tree from a Dicom dataset.
 
     Parameters
     ----------
-    tree : dict | None
-        The dictionary tree object.
+    parent : tree.Node
+        The node to add the elements of the dataset to.
     ds : pydicom.dataset.Dataset
-        The dataset object to add to the dict tree.
-    parent : dict | None
-        The parent dict in the tree (if any), default is `None` (no parent).
+        The dataset object to add to the tree.
+    max_depth : int | None
+        The maximum number of nested sequences to descend into. Default is
+        `None`, which means that all sequences are added to the tree.
     """
-    # For each DataElement in the current Dataset
-    for idx, elem in enumerate(ds):
-        # print(idx, elem)
-        node = tree.Node(str(elem), elem, parent=parent)
-        # parent.add(node)
-
-        if elem.VR == "SQ":
-            # DataElement is a sequence, containing 0 or more Datasets
-            for seq_idx, seq_item in enumerate(elem.value):
-                seq_label = f"{elem.name} Item {seq_idx + 1}"
-                seq_node = tree.Node(seq_label, seq_item, parent=node)
-                # node.add(seq_node)
-
-                # Recurse into the sequence item(s)
-                build_tree(seq_node, seq_item)
+    # Walk the datasets depth-first with an explicit stack, instead of
+    # recursing into each sequence item
+    stack = [(parent, ds, max_depth)]
+    while stack:
+        parent_, ds_, max_depth_ = stack.pop()
+
+        # Add a node for each DataElement in the current Dataset at once
+        elems = list(ds_)
+        nodes = [tree.Node(str(elem), elem) for elem in elems]
+        parent_.add_children(nodes)
+
+        for elem, node in zip(elems, nodes):
+            if elem.VR == "SQ" and (max_depth_ is None or max_depth_ > 0):
+                # DataElement is a sequence, containing 0 or more Datasets
+                seq_nodes = [tree.Node(f"{elem.name} Item {seq_idx + 1}",
+                                       seq_item)
+                             for seq_idx, seq_item in enumerate(elem.value)]
+                node.add_children(seq_nodes)
+
+                # Add the elements of the sequence item(s) later
+                for seq_node in seq_nodes:
+                    stack.append((seq_node,
+                                  seq_node.data,
+                                  None if max_depth_ is None
+                                  else max_depth_ - 1))
 
     return parent
 
 
+# The tags read by `read_dicom_slice` when only reading the metadata
+METADATA_TAGS = ["SeriesInstanceUID",
+                 "Columns",
+                 "Rows",
+                 "PixelSpacing",
+                 "SliceThickness",
+                 "Modality",
+                 "SliceLocation",
+                 "InstanceNumber",
+                 ]
+
+
 def fix_siuid(SIUID: str,
               ):
-    """Make sure that SIUIDs conform to the same format."""
-    SIUID = SIUID.replace("/", "_")
+    """Make sure that SIUIDs conform to the same format.
+
+    The SIUIDs are interned, since they are used repeatedly as dict keys.
+    """
+    SIUID = sys.intern(SIUID.replace("/", "_"))
     return SIUID
 
 
+def _is_dicom_file(file: pathlib.Path,
+                   ) -> bool:
+    """Check for the "DICM" prefix after the 128 byte Dicom preamble."""
+    try:
+        with file.open("rb") as fp:
+            fp.seek(128)
+            return fp.read(4) == b"DICM"
+    except OSError:
+        return False
+
+
 def read_dicom_slice(
         file: pathlib.Path,
         dtype: np.typing.DTypeLike = np.float32,
         escalation: errors.Escalation = errors.Escalation.WARNING,
         verbosity: int = utils.settings.verbosity,
+        metadata_only: bool = False,
         ) -> dict[str, typing.Union[list, image.Image]]:
-    """Read a single Dicom file with an image slice."""
+    """Read a single Dicom file with an image slice.
+
+    If `metadata_only` is `True`, only the tags needed to group and validate
+    the slices are read, and the pixel data is skipped.
+    """
     if not file.is_file():
         raise ValueError(f"The file ('{str(file)}') is not a file.")
 
+    return _read_dicom_slice(file,
+                             dtype,
+                             escalation=escalation,
+                             verbosity=verbosity,
+                             metadata_only=metadata_only,
+                             )
+
+
+def _read_dicom_slice(
+        file: pathlib.Path,
+        dtype: np.typing.DTypeLike = np.float32,
+        escalation: errors.Escalation = errors.Escalation.WARNING,
+        verbosity: int = utils.settings.verbosity,
+        metadata_only: bool = False,
+        ) -> dict[str, typing.Union[list, image.Image]]:
+    """Read a Dicom file that is already known to be a regular file.
+
+    Used by `read_directory`, whose directory listing has already told the
+    regular files apart, so that no extra `stat` is made per file.
+    """
+    # Reject non-Dicom files before handing them to pydicom
+    if not _is_dicom_file(file):
+        raise pydicom.errors.InvalidDicomError(
+            f"Invalid Dicom file (can't load): {file}.")
+
     try:
         # Read the DICOM file
-        ds = pydicom.dcmread(file)
-        if verbosity >= 3:
+        if metadata_only:
+            ds = pydicom.dcmread(file,
+                                 stop_before_pixels=True,
+                                 specific_tags=METADATA_TAGS,
+                                 )
+        else:
+            ds = pydicom.dcmread(file)
+        if verbosity >= 3:  # Only build the tree if it is printed
             print(build_tree(tree.Node("root"), ds).render())
     except pydicom.errors.InvalidDicomError:
         raise pydicom.errors.InvalidDicomError(
@@ -174,13 +247,18 @@ def read_dicom_slice(
         raise pydicom.errors.InvalidDicomError(
             f"Invalid Dicom file found (no PixelSpacing): {file}.")
     else:
-        pixel_spacing = tuple(s.real for s in ds.PixelSpacing)
+        pixel_spacing = tuple(
+            np.asarray(ds.PixelSpacing, dtype=np.float64).reshape(-1).tolist())
+        if len(pixel_spacing) != 2:
+            raise pydicom.errors.InvalidDicomError(
+                f"Invalid Dicom file found (PixelSpacing must have two "
+                f"values): {file}.")
 
     if not hasattr(ds, "SliceThickness"):
         raise pydicom.errors.InvalidDicomError(
             f"Invalid Dicom file found (no SliceThickness): {file}.")
     else:
-        slice_thickness = ds.SliceThickness.real
+        slice_thickness = float(ds.SliceThickness)
 
     if not hasattr(ds, "Modality"):
         raise pydicom.errors.InvalidDicomError(
@@ -188,7 +266,52 @@ def read_dicom_slice(
     else:
         modality = str(ds.Modality)
 
-    return SIUID, ds, columns, rows, pixel_spacing, slice_thickness, modality
+    if not hasattr(ds, "SliceLocation"):
+        raise pydicom.errors.InvalidDicomError(
+            f"Invalid Dicom file found (no SliceLocation): {file}.")
+    else:
+        slice_location = float(ds.SliceLocation)
+
+    return SIUID, ds, columns, rows, pixel_spacing, slice_thickness, \
+        modality, slice_location
+
+
+def _scandir_files(path: pathlib.Path,
+                   ) -> typing.Iterator[os.DirEntry]:
+    """Yield the regular files in a directory, skipping symbolic links.
+
+    The `os.DirEntry` objects cache the file type, so no extra `stat` calls
+    are needed to tell files from directories.
+    """
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_symlink():
+                continue
+            if entry.is_file(follow_symlinks=False):
+                yield entry
+
+
+def _read_slice(file: pathlib.Path,
+                out: np.ndarray,
+                rescale: bool,
+                ):
+    """Read the pixel data of a file into `out`, converting its dtype.
+
+    If `rescale` is `True`, the RescaleSlope and RescaleIntercept of the file
+    are applied as well.
+    """
+    ds = pydicom.dcmread(file)
+    pixel_array = ds.pixel_array
+    if pixel_array.shape != out.shape:
+        raise errors.InvalidDicomError("The pixel array shapes are "
+                                       "inconsistent.")
+
+    slope = float(ds.get("RescaleSlope", 1.0))
+    intercept = float(ds.get("RescaleIntercept", 0.0))
+    if rescale and (slope != 1.0 or intercept != 0.0):
+        kernels.cast_rescale(pixel_array, out, slope, intercept)
+    else:
+        np.copyto(out, pixel_array, casting="unsafe")
 
 
 def read_directory(
@@ -196,26 +319,34 @@ def read_directory(
         dtype: np.typing.DTypeLike = np.float32,
         escalation: errors.Escalation = errors.Escalation.WARNING,
         verbosity: int = utils.settings.verbosity,
+        num_workers: int = utils.settings.num_workers,
+        entries: typing.Union[list[os.DirEntry], None] = None,
+        rescale: bool = True,
+        memmap: bool = utils.settings.memmap,
         ) -> dict[str, image.Image]:
-    """Read the Dicom files in a directory as one or more images."""
-    if not path.is_dir():
-        raise ValueError(f"The path ('{str(path)}') is not a directory.")
-
-    # Find all files in the directory
-    files = utils.find_files(path, "*", verbosity=verbosity)
-
-    # If we are to print info, count the number of regular files in directory
-    if verbosity > 0:
-        count_files = 0
-        for file in files:
-            if file.is_file():
-                count_files += 1
-            else:
-                print(file)
-        utils.verbose("dicom.read_directory",
-                      f"Found {count_files} (of {len(files)}) regular files "
-                      f"in directory '{path}'.",
-                      1, verbosity)
+    """Read the Dicom files in a directory as one or more images.
+
+    The files are read in parallel using `num_workers` threads. If the regular
+    files in the directory have already been listed, they can be passed as
+    `entries`, and the directory is not listed (or checked) again.
+
+    If `rescale` is `True`, the RescaleSlope and RescaleIntercept of the slices
+    are applied to the pixel values (e.g., giving Hounsfield units for CT).
+
+    If `memmap` is `True`, the pixel arrays of the images are stored in
+    temporary files, instead of in memory. The files are created in
+    `utils.settings.memmap_dir`, or in the system's default temporary
+    directory if it is `None`.
+    """
+    # Find all regular files in the directory
+    if entries is None:
+        if not path.is_dir():
+            raise ValueError(f"The path ('{str(path)}') is not a directory.")
+        entries = _scandir_files(path)
+    files = [pathlib.Path(entry.path) for entry in entries]
+    utils.verbose("dicom.read_directory",
+                  f"Found {len(files)} regular files in directory '{path}'.",
+                  1, verbosity)
 
     def err_msg(where, message):
         errors.escalate(
@@ -234,100 +365,135 @@ def read_directory(
         return images
         # raise RuntimeError("No files found in this directory.")
 
-    # First read all slices in the given directory
-    num_images = 0
-    num_slices = 0
-    for file in files:
-        if not file.is_file():
-            continue  # Skip unless a regular file
-
-        try:
-            # print(file)
-            SIUID, ds, columns, rows, pixel_spacing, slice_thickness, modality\
-                = read_dicom_slice(file,
+    # The same worker threads read the metadata, and then the pixels, of all
+    # the series in the directory
+    with concurrent.futures.ThreadPoolExecutor(num_workers) as executor:
+        # First read all slices in the given directory. The files are read in
+        # parallel, but the results are collected here, in file order.
+        futures = [executor.submit(_read_dicom_slice,
+                                   file,
                                    dtype,
                                    escalation=escalation,
                                    verbosity=verbosity,
+                                   metadata_only=True,
                                    )
-            if SIUID not in images:
-                images[SIUID] = {"Slices": [ds],
-                                 "Columns": [columns],
-                                 "Rows": [rows],
-                                 "PixelSpacing": [pixel_spacing],
-                                 "SliceThickness": [slice_thickness],
-                                 "Modality": [modality]
-                                 }
-                num_images += 1
-            else:
-                images[SIUID]["Slices"].append(ds)
-                images[SIUID]["Columns"].append(columns)
-                images[SIUID]["Rows"].append(rows)
-                images[SIUID]["PixelSpacing"].append(pixel_spacing)
-                images[SIUID]["SliceThickness"].append(slice_thickness)
-                images[SIUID]["Modality"].append(modality)
-        except pydicom.errors.InvalidDicomError as e:
-            err_msg("dicom.read_directory.read_dicom_slice", e.args[0])
-            continue
-        num_slices += 1
-
-    utils.verbose("dicom.read_directory",
-                  f"Read {num_slices} slices in {num_images} Dicom image(s) "
-                  f"in directory '{path}'.",
-                  1, verbosity)
+                   for file in files]
+        # Only keep the file paths and metadata, not the datasets themselves
+        metadata = []
+        for file, future in zip(files, futures):
+            try:
+                SIUID, _, columns, rows, pixel_spacing, slice_thickness, \
+                    modality, slice_location = future.result()
+            except pydicom.errors.InvalidDicomError as e:
+                err_msg("dicom.read_directory.read_dicom_slice", e.args[0])
+                continue
+            metadata.append((SIUID, file, columns, rows, pixel_spacing,
+                             slice_thickness, modality, slice_location))
+
+        # Group the slices by series. The number of slices in each series is
+        # then known, and the metadata is stored in arrays of that size.
+        series_slices = dict()
+        for i, (SIUID, *_) in enumerate(metadata):
+            series_slices.setdefault(SIUID, []).append(i)
+
+        for SIUID, indices in series_slices.items():
+            n = len(indices)
+            series = {"Files": [None] * n,
+                      "Columns": np.empty(n, dtype=np.int32),
+                      "Rows": np.empty(n, dtype=np.int32),
+                      "PixelSpacing": np.empty((n, 2), dtype=np.float64),
+                      "SliceThickness": np.empty(n, dtype=np.float64),
+                      "Modality": np.empty(n, dtype=object),
+                      "SliceLocation": np.empty(n, dtype=np.float64),
+                      }
+            for j, i in enumerate(indices):
+                (_,
+                 series["Files"][j],
+                 series["Columns"][j],
+                 series["Rows"][j],
+                 series["PixelSpacing"][j],
+                 series["SliceThickness"][j],
+                 series["Modality"][j],
+                 series["SliceLocation"][j]) = metadata[i]
+            images[SIUID] = series
 
-    # Then order and check all the integrity of all images (series) found
-    for SIUID in images:
-        slices = images[SIUID]["Slices"]
-        # Sort the slices by the slice location (physical location in machine)
-        # TODO: Choice how to sort? Sorted by InstanceNumber before?
-        slices = sorted(slices, key=lambda s: s.SliceLocation)
-        images[SIUID]["Slices"] = slices
-
-        for key, what in [["Columns", "columns"],
-                          ["Rows", "rows"],
-                          ["PixelSpacing", "spacings"],
-                          ["SliceThickness", "thicknesses"],
-                          ["Modality", "modalities"],
-                          ]:
-            # if len(set(seriesUIDs)) > 1:
-            #     raise errors.InvalidDicomError("The images have different "
-            #                                    "Series Instance UIDs.")
-            if len(set(images[SIUID][key])) > 1:
-                del images[SIUID]
+        utils.verbose("dicom.read_directory",
+                      f"Read {len(metadata)} slices in {len(images)} Dicom "
+                      f"image(s) in directory '{path}'.",
+                      1, verbosity)
+        del metadata
+
+        # Then order and check all the integrity of all images (series) found
+        to_remove = set()
+        for SIUID in images:
+            # Check that all slices agree with the first one
+            checks = [["Columns", "columns"],
+                      ["Rows", "rows"],
+                      ["PixelSpacing", "spacings"],
+                      ["SliceThickness", "thicknesses"],
+                      ["Modality", "modalities"],
+                      ]
+            num_slices = len(images[SIUID]["Files"])
+            differs = [(images[SIUID][key] != images[SIUID][key][0])
+                       .reshape(num_slices, -1).any(axis=1)
+                       for key, _ in checks]
+            inconsistent = np.logical_or.reduce(differs)
+            if inconsistent.any():
+                # Find what is inconsistent only when reporting it
+                i = int(np.argmax(inconsistent))
+                what = ", ".join(what for (_, what), differs_
+                                 in zip(checks, differs) if differs_[i])
+                to_remove.add(SIUID)
                 err_msg("dicom.read_directory",
                         f"The slice {what} are inconsistent ({SIUID}, "
-                        f"'{file}'.")
-
-        spacing = (*images[SIUID]["PixelSpacing"][0],
-                   images[SIUID]["SliceThickness"][0])
-
-        # TODO: Take ImageOrientation into account!
-        shape = (images[SIUID]["Columns"][0],
-                 images[SIUID]["Rows"][0],
-                 len(images[SIUID]["Slices"]))
-
-        modality = images[SIUID]["Modality"][0]
-
-        # Create 3D array
-        img = image.Image(path.name,
-                          shape,
-                          pixel_spacing=spacing,
-                          series_id=SIUID,
-                          modality=modality,
-                          dtype=dtype)
-
-        # Fill the image with the data from the Dicom files
-        slices = images[SIUID]["Slices"]
-        for i, slice_ in enumerate(slices):
-            pixel_array = slice_.pixel_array.astype(dtype)
-
-            if pixel_array.shape != shape[:-1]:
-                raise errors.InvalidDicomError("The pixel array shapes are "
-                                               "inconsistent.")
-
-            img.set_slice(i, pixel_array)
-
-        images[SIUID] = img
+                        f"'{images[SIUID]['Files'][i]}').")
+                continue
+
+            # Sort the slices by the slice location (physical location in
+            # machine)
+            # TODO: Choice how to sort? Sorted by InstanceNumber before?
+            order = np.argsort(images[SIUID]["SliceLocation"], kind="stable")
+            files = images[SIUID]["Files"]
+            images[SIUID]["Files"] = [files[i] for i in order]
+
+            spacing = (*images[SIUID]["PixelSpacing"][0].tolist(),
+                       float(images[SIUID]["SliceThickness"][0]))
+
+            # TODO: Take ImageOrientation into account!
+            # The pixel arrays are stored as Rows x Columns
+            shape = (int(images[SIUID]["Rows"][0]),
+                     int(images[SIUID]["Columns"][0]),
+                     len(images[SIUID]["Files"]))
+
+            modality = images[SIUID]["Modality"][0]
+
+            # Create 3D array
+            img = image.Image(path.name,
+                              shape,
+                              pixel_spacing=spacing,
+                              series_id=SIUID,
+                              modality=modality,
+                              dtype=dtype,
+                              # All slices are set below
+                              init="memmap" if memmap else "empty")
+
+            # Fill the image with the data from the Dicom files. Only the files
+            # in the series that passed the checks above have their pixels
+            # read. Each worker reads a file, and converts (and rescales) its
+            # pixels directly into its own slice of the image.
+            files = images[SIUID]["Files"]
+            buffers = [img.get_slice_buffer(i) for i in range(len(files))]
+            for _ in executor.map(_read_slice,
+                                  files,
+                                  buffers,
+                                  [rescale] * len(files)):
+                pass  # Raise any errors from the workers
+
+            images[SIUID] = img
+
+    # Drop the inconsistent images (not while iterating over them above)
+    for SIUID in to_remove:
+        del images[SIUID]
 
     return images
 
@@ -347,38 +513,116 @@ def read_directory(
     # plt.show()
 
 
+def _list_directory(path: pathlib.Path,
+                    ) -> tuple[list[os.DirEntry], list[os.DirEntry]]:
+    """List a directory once, and split it into files and subdirectories.
+
+    Symbolic links are skipped. This is the only file system call made for
+    the directory itself.
+    """
+    file_entries = []
+    dir_entries = []
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_symlink():
+                continue
+            if entry.is_file(follow_symlinks=False):
+                file_entries.append(entry)
+            elif entry.is_dir(follow_symlinks=False):
+                dir_entries.append(entry)
+
+    return file_entries, dir_entries
+
+
 def find_all_dicom_files(
         path: pathlib.Path,
         dtype: np.typing.DTypeLike = np.float32,
         escalation: errors.Escalation = errors.Escalation.WARNING,
         verbosity: int = utils.settings.verbosity,
+        num_workers: int = utils.settings.num_workers,
+        rescale: bool = True,
+        memmap: bool = utils.settings.memmap,
         ) -> dict[str, typing.Union[dict, image.Image]]:
-    """Traverse a directory and find all Dicom files in it."""
-    if not path.is_dir():
+    """Traverse a directory and find all Dicom files in it.
+
+    Subdirectories that cannot be listed (e.g., without permission) are
+    skipped, but the given directory itself must be readable.
+    """
+    try:
+        entries = _list_directory(path)
+    except (FileNotFoundError, NotADirectoryError):
         raise ValueError(f"Provided path is not a directory ({path}).")
 
+    return _find_all_dicom_files(path,
+                                 entries,
+                                 dtype=dtype,
+                                 escalation=escalation,
+                                 verbosity=verbosity,
+                                 num_workers=num_workers,
+                                 rescale=rescale,
+                                 memmap=memmap,
+                                 )
+
+
+def _find_all_dicom_files(
+        path: pathlib.Path,
+        entries: tuple[list[os.DirEntry], list[os.DirEntry]],
+        dtype: np.typing.DTypeLike,
+        escalation: errors.Escalation,
+        verbosity: int,
+        num_workers: int,
+        rescale: bool,
+        memmap: bool,
+        ) -> dict[str, typing.Union[dict, image.Image]]:
+    """Find all Dicom files in an already listed directory, recursively."""
+    def err_msg(where, message):
+        errors.escalate(
+            escalation,
+            message,
+            error_postfix="",
+            warn_postfix=" Ignoring.",
+            error=RuntimeError,
+            warning=UserWarning,
+            nothing=lambda: utils.verbose(where, message, 2, verbosity),
+            )
+
+    file_entries, dir_entries = entries
+
     # Load and parse all images in this directory
     dicoms = read_directory(path,
                             dtype=dtype,
                             escalation=escalation,
                             verbosity=verbosity,
+                            num_workers=num_workers,
+                            entries=file_entries,
+                            rescale=rescale,
+                            memmap=memmap,
                             )
 
-    # Find subdirectories
-    files = utils.find_files(path, "*", verbosity=verbosity)
-    for file in files:
-        if file.is_dir():
-            # print(file)
-            # Go through subdirectories recursively
-            subdir_dicoms = find_all_dicom_files(file,
-                                                 escalation=escalation,
-                                                 verbosity=verbosity,
-                                                 )
-            for k in subdir_dicoms:
-                # "DirectoryName/SeriesID"
-                k_ = str(pathlib.Path(str(file.name), str(k)))
-                # k_ = f"{file.name}/{k}"
-                dicoms[k_] = subdir_dicoms[k]
+    for entry in dir_entries:
+        subdir = pathlib.Path(entry.path)
+        try:
+            subdir_entries = _list_directory(subdir)
+        except OSError as e:
+            err_msg("dicom.find_all_dicom_files",
+                    f"Could not list directory '{subdir}' ({e}).")
+            continue
+
+        # Go through subdirectories recursively
+        subdir_dicoms = _find_all_dicom_files(subdir,
+                                              subdir_entries,
+                                              dtype=dtype,
+                                              escalation=escalation,
+                                              verbosity=verbosity,
+                                              num_workers=num_workers,
+                                              rescale=rescale,
+                                              memmap=memmap,
+                                              )
+        for k in subdir_dicoms:
+            # "DirectoryName/SeriesID"
+            k_ = str(pathlib.Path(str(subdir.name), str(k)))
+            # k_ = f"{subdir.name}/{k}"
+            dicoms[k_] = subdir_dicoms[k]
 
     return dicoms
 
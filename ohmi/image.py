@@ -11,25 +11,40 @@ Copyright (c) 2025, Tommy Löfstedt. All rights reserved.
 """
 import enum
 import typing
+import tempfile
 
 import numpy as np
 import numpy.typing
 
+import utils
+
 __all__ = ["Image"]
 
 
 class ImagePlane(enum.Enum):
-    AXIAL = "AXIAL"
-    SAGITTAL = "SAGITTAL"
-    CORONAL = "CORONAL"
+    AXIAL = 0
+    SAGITTAL = 1
+    CORONAL = 2
 
 
 class Image(object):
     """A class for images.
 
     An image is oriented as Horizontal x Vertical x Depth.
+
+    Internally, the pixel array is stored with the slice (last) axis first, so
+    that each slice is contiguous in memory. The `data` property returns a
+    view in the public orientation.
     """
 
+    # The axis of the image plane, and a function that slices the internal,
+    # slice-first, pixel array in that plane
+    _SLICERS = {
+        ImagePlane.AXIAL: (2, lambda data, index: data[index]),
+        ImagePlane.SAGITTAL: (1, lambda data, index: data[:, :, index].T),
+        ImagePlane.CORONAL: (0, lambda data, index: data[:, index, :].T),
+        }
+
     def __init__(self,
                  name: str,
                  shape: tuple[int, ...],
@@ -37,13 +52,34 @@ class Image(object):
                  series_id: typing.Union[str, None] = None,
                  modality: typing.Union[str, None] = None,
                  dtype: np.typing.DTypeLike = np.float32,
+                 init: str = "zeros",
                  ):
 
-        if isinstance(shape, (tuple, list)):
-            self._data = np.zeros(shape, dtype=dtype)
-        else:
+        if not isinstance(shape, (tuple, list)):
             raise ValueError("The shape must be a tuple of integers.")
 
+        # With "empty", the array is not initialised, and the caller must set
+        # all slices before reading them. With "memmap", the array is zeros
+        # backed by a temporary file in `utils.settings.memmap_dir`, so that
+        # only the slices in use need to be resident in memory.
+        internal_shape = (shape[-1], *shape[:-1])
+        if init == "zeros":
+            self._data = np.zeros(internal_shape, dtype=dtype)
+        elif init == "empty":
+            self._data = np.empty(internal_shape, dtype=dtype)
+        elif init == "memmap":
+            self._data = np.memmap(
+                tempfile.TemporaryFile(dir=utils.settings.memmap_dir),
+                dtype=dtype,
+                mode="w+",
+                shape=internal_shape)
+        else:
+            raise ValueError(f"Unknown init {init}. Must be 'zeros', 'empty' "
+                             f"or 'memmap'.")
+
+        # Keep track of which slices hold valid data
+        self._set_mask = np.full(shape[-1], init != "empty", dtype=bool)
+
         self.name = name
         self.pixel_spacing = pixel_spacing
         self.series_id = series_id
@@ -67,13 +103,18 @@ class Image(object):
     @property
     def data(self):
         """The pixel array data of this image."""
-        return self._data
+        return np.moveaxis(self._data, 0, -1)
 
     @property
     def shape(self):
         """The shape property of this image."""
         return self.data.shape
 
+    @property
+    def memmap(self):
+        """Whether the pixel array is backed by a file on disk."""
+        return isinstance(self._data, np.memmap)
+
     @property
     def pixel_spacing(self):
         """The pixel spacing (distance between voxel centres) in the image."""
@@ -84,7 +125,7 @@ class Image(object):
         """Set the pixel spacing (dist. between voxel centres) in the image."""
         if value is None:
             self._pixel_spacing = None
-            self._aspect_ratios = None
+            self._set_aspect_ratios(None)
         else:
             self._pixel_spacing = tuple(value)
             self._set_aspect_ratios(self.pixel_spacing)
@@ -124,24 +165,22 @@ class Image(object):
                       image_plane: typing.Union[ImagePlane, None] = None,
                       ):
         """Get the aspect ratio in the image."""
-        if self.ndim == 1 or self.ndim == 2:
-            return self._aspect_ratios
-        elif self.ndim == 3:
-            if image_plane is None:
-                return self._aspect_ratios
-            elif image_plane == ImagePlane.AXIAL:
-                return self._aspect_ratios[0]
-            elif image_plane == ImagePlane.SAGITTAL:
-                return self._aspect_ratios[1]
-            elif image_plane == ImagePlane.CORONAL:
-                return self._aspect_ratios[2]
-            else:
-                raise ValueError("Unknown image plane. Must be of type "
-                                 "`ImagePlane`.")
-        else:
+        if self.ndim > 3:
             raise ValueError("Number of image dimensions not supported!")
+        if image_plane is None or self.ndim < 3:
+            return self._aspect_ratios
+        try:
+            return self._aspect_ratio_map[image_plane]
+        except KeyError:
+            raise ValueError("Unknown image plane. Must be of type "
+                             "`ImagePlane`.")
 
     def _set_aspect_ratios(self, pixel_spacing):
+        if pixel_spacing is None:
+            self._aspect_ratios = None
+            self._aspect_ratio_map = {plane: None for plane in ImagePlane}
+            return
+
         if len(pixel_spacing) != self.ndim:
             raise ValueError(f"Pixel spacing must be provided for {self.ndim} "
                              f"dimensions.")
@@ -154,23 +193,42 @@ class Image(object):
                                    pixel_spacing[1] / pixel_spacing[2],  # sag
                                    pixel_spacing[2] / pixel_spacing[0],  # cor
                                    ]
+            self._aspect_ratio_map = {
+                ImagePlane.AXIAL: self._aspect_ratios[0],
+                ImagePlane.SAGITTAL: self._aspect_ratios[1],
+                ImagePlane.CORONAL: self._aspect_ratios[2],
+                }
         else:
             raise ValueError("Number of image dimensions not supported!")
 
     def set_slice(self, index, data, copy=False):
-        """Set a slice in the image."""
+        """Set a slice in the image.
+
+        The data is always copied into the image (and converted to its dtype),
+        so `copy` has no effect. It is kept for backwards compatibility.
+        """
         # TODO: If time, need to adjust for the length of ndim and shapes.
-        if (len(data.shape) != self.ndim - 1) or data.shape != self.shape[:-1]:
-            return RuntimeError(f"Given slice has wrong size. Expected "
-                                f"{self.shape[:-1]} but got {data.shape}.")
+        if data.shape != self._data.shape[1:]:
+            raise ValueError(f"Given slice has wrong size. Expected "
+                             f"{self._data.shape[1:]} but got {data.shape}.")
         index = int(index)
-        if index < 0 or index > self.shape[-1] - 1:
-            return IndexError("List index out of range.")
+        if index < 0 or index >= self._data.shape[0]:
+            raise IndexError("List index out of range.")
 
-        if copy:
-            self.data[..., index] = data.copy()
-        else:
-            self.data[..., index] = data
+        self._data[index] = data
+        self._set_mask[index] = True
+
+    def get_slice_buffer(self, index):
+        """Get a writable view of a slice in the image.
+
+        Writing to the returned array writes directly into the image, without
+        the temporary array that `set_slice` needs for e.g. dtype conversions.
+        The slice is considered set once its buffer has been requested.
+        """
+        index = int(index)
+        self._set_mask[index] = True
+
+        return self._data[index]
 
     def get_slice(self,
                   index: int,
@@ -183,30 +241,30 @@ class Image(object):
         if self.ndim == 2:
             num_slices = 1
         elif self.ndim == 3:
-            if image_plane == ImagePlane.AXIAL:
-                num_slices = self.shape[2]
-            elif image_plane == ImagePlane.SAGITTAL:
-                num_slices = self.shape[1]
-            elif image_plane == ImagePlane.CORONAL:
-                num_slices = self.shape[0]
-            else:
+            try:
+                axis, slicer = self._SLICERS[image_plane]
+            except KeyError:
                 raise ValueError(f"Unknown image plane {str(image_plane)}.")
+            num_slices = self.shape[axis]
         else:
             raise ValueError("Need a 2D or 3D image to get a slice.")
 
         if index < 0 or index >= num_slices:
-            return IndexError("List index out of range.")
+            raise IndexError("List index out of range.")
+
+        # Axial slices only need their own slice to be set, other planes cut
+        # through all slices
+        if image_plane == ImagePlane.AXIAL and self.ndim == 3:
+            is_set = self._set_mask[index]
+        else:
+            is_set = self._set_mask.all()
+        if not is_set:
+            raise RuntimeError("The slice has not been set in the image.")
 
         if self.ndim == 2:
             image = self.data
-        elif image_plane == ImagePlane.AXIAL:
-            image = self.data[:, :, index]
-        elif image_plane == ImagePlane.SAGITTAL:
-            image = self.data[:, index, :]
-        elif image_plane == ImagePlane.CORONAL:
-            image = self.data[index, :, :]
         else:
-            raise RuntimeError("Cannot happen.")
+            image = slicer(self._data, index)
 
         if copy:
             image = image.copy()
@@ -220,3 +278,7 @@ class Image(object):
     def max(self):
         """Return the maximum intensity in the image."""
         return self.data.max()
+
+    def minmax(self):
+        """Return the minimum and maximum intensities in the image."""
+        return self._data.min(), self._data.max()
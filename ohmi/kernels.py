@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fused array kernels for converting pixel data.
+
+The kernels are compiled with Numba if it is installed, and otherwise fall
+back to NumPy.
+
+Created on Thu Oct 15 10:12:31 2026
+
+Copyright (c) 2025, Tommy Löfstedt. All rights reserved.
+
+@author:  Tommy Löfstedt
+@email:   tommy.lofstedt@umu.se
+@license: BSD 3-clause.
+"""
+import numpy as np
+
+try:
+    import numba
+except ImportError:  # Numba is optional
+    numba = None
+
+__all__ = ["cast_rescale"]
+
+
+if numba is not None:
+    # Serial, but without the GIL: dicom.read_directory converts the slices
+    # in parallel worker threads, so a parallel kernel would only compete
+    # with them for the cores
+    @numba.njit(cache=True, nogil=True)
+    def _cast_rescale_numba(src, dst, slope, intercept):
+        for i in range(src.shape[0]):
+            for j in range(src.shape[1]):
+                dst[i, j] = src[i, j] * slope + intercept
+
+
+def _cast_rescale_numpy(src, dst, slope, intercept):
+    # Compute in float64 and cast once, as the Numba kernel does, so that
+    # integer outputs are not truncated before the intercept is added
+    tmp = np.multiply(src, slope, dtype=np.float64)
+    tmp += intercept
+    np.copyto(dst, tmp, casting="unsafe")
+
+
+def cast_rescale(src: np.ndarray,
+                 dst: np.ndarray,
+                 slope: float = 1.0,
+                 intercept: float = 0.0,
+                 ):
+    """Compute `dst = src * slope + intercept` in one pass over the data.
+
+    The result is cast to the dtype of `dst`, which is written in-place.
+    """
+    if src.shape != dst.shape:
+        raise ValueError(f"The arrays must have the same shape, but got "
+                         f"{src.shape} and {dst.shape}.")
+
+    if numba is not None and src.ndim == 2:
+        _cast_rescale_numba(src, dst, slope, intercept)
+    else:
+        _cast_rescale_numpy(src, dst, slope, intercept)
@@ -12,15 +12,18 @@ Copyright (c) 2025, Tommy Löfstedt. All rights reserved.
 import sys
 import typing
 import pathlib
-import threading
+
+import numpy as np
 
 # from PySide2 import QtGui
+from PySide2 import QtCore
 from PySide2 import QtWidgets
 
 from gui.main import Ui_MainWindow
 
 import matplotlib.pyplot as plt
 from matplotlib.figure import Figure
+from matplotlib.colors import NoNorm
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
 
 import utils
@@ -32,6 +35,14 @@ import errors
 class MplCanvas(FigureCanvasQTAgg):
     """A Matplotlib window."""
 
+    # The maximum number of voxels converted to grey levels at a time
+    CHUNK_SIZE = 1 << 24
+
+    # The image planes, in the order their state is stored in
+    PLANES = (image.ImagePlane.AXIAL,
+              image.ImagePlane.SAGITTAL,
+              image.ImagePlane.CORONAL)
+
     class IndexTracker:
         """Keep track of the slice index in an axis."""
 
@@ -45,18 +56,28 @@ class MplCanvas(FigureCanvasQTAgg):
             self.speed = int(speed)
             self.interval = float(interval)
 
-            self.timer = None
+            # Scroll steps are accumulated per plane until the timer fires,
+            # and are then all applied with a single redraw (on the GUI thread)
+            self.pending = {image_plane: 0 for image_plane, _ in plane_axes}
+            self.timer = QtCore.QTimer()
+            self.timer.setSingleShot(True)
+            self.timer.setInterval(int(self.interval * 1000))
+            self.timer.timeout.connect(self.apply_pending)
+
+        def update_timer(self, change, image_plane):
+            """Add a scroll step and restart the timer to update the image."""
+            self.pending[image_plane] += change
+            self.timer.start()
 
-        def update_timer(self, *args):
-            """Set a timer to update the image."""
-            if (self.timer is not None) and self.timer.is_alive():
-                self.timer.cancel()
+        def apply_pending(self):
+            """Apply the accumulated scroll steps and update the image once."""
+            for image_plane, change in self.pending.items():
+                if change != 0:
+                    self.parent.increase_index(change, image_plane,
+                                               update=False)
+                    self.pending[image_plane] = 0
 
-            self.timer = threading.Timer(self.interval,
-                                         self.parent.increase_index,
-                                         args=args,
-                                         )
-            self.timer.start()
+            self.parent.update_image()
 
         def on_scroll(self, event):
             """Handle the scroll event."""
@@ -69,8 +90,13 @@ class MplCanvas(FigureCanvasQTAgg):
 
                     self.update_timer(change, image_plane)
 
-    def __init__(self, parent=None, width=12, height=8, dpi=300):
+    def __init__(self, parent=None, width=5, height=4, dpi=100):
+        """Create the canvas.
 
+        The `dpi` is for the screen; a high value such as 300 is only useful
+        when saving the figure to a file. HiDPI screens are handled by the Qt
+        backend, which scales the canvas by the device pixel ratio.
+        """
         fig = Figure(figsize=(width, height), dpi=dpi)
         self.axes = [[None, None],
                      [None, None]]
@@ -107,20 +133,80 @@ class MplCanvas(FigureCanvasQTAgg):
 
         # self.fig = fig
 
+        # The figure paints its whole area, so nothing behind needs painting
+        self.setAttribute(QtCore.Qt.WA_OpaquePaintEvent, True)
+
         self.parent = parent
 
         # self.axes[0][0].plot([0, 1, 2, 3, 4], [10, 1, 20, 3, 40])
 
         self.cmap = plt.cm.gray
-        self.index_ax = 0
-        self.index_sag = 0
-        self.index_cor = 0
-        self.display_ax = None
-        self.display_sag = None
-        self.display_cor = None
-        self.imshow_ax = None
-        self.imshow_sag = None
-        self.imshow_cor = None
+
+        # The axes and state of each image plane, indexed by the plane's value
+        self.plane_axes = [self.axes[0][0], self.axes[0][1], self.axes[1][0]]
+        self.index = [0, 0, 0]
+        self.display = [None, None, None]
+        self.num_slices = [0, 0, 0]
+        self.imshow = [None, None, None]
+        self.stacks = [None, None, None]
+        self.aspects = [None, None, None]
+
+        # Backgrounds of the image axes, for blitting only the changed images
+        self.backgrounds = None
+        self.mpl_connect("draw_event", self.on_draw)
+        self.mpl_connect("resize_event", self.on_resize)
+
+    def on_draw(self, event):
+        """Save the axes backgrounds after a full draw, for blitting."""
+        self.backgrounds = [self.copy_from_bbox(ax.bbox)
+                            for ax in self.plane_axes]
+
+        # The images are animated, and are thus not drawn by a full draw
+        for ax, imshow in zip(self.plane_axes, self.imshow):
+            if imshow is not None:
+                ax.draw_artist(imshow)
+
+    def on_resize(self, event):
+        """Downsample the displayed slices again for the new axes sizes."""
+        for i, imshow in enumerate(self.imshow):
+            if imshow is not None:
+                imshow.set_data(self.downsample(
+                    self.stacks[i][self.display[i]], self.plane_axes[i]))
+
+    @staticmethod
+    def downsample(im, ax):
+        """Stride a slice down to about the size of the axes on screen.
+
+        Slices more than twice as large as the axes are shown as a strided
+        view, so that the renderer does not resample more pixels than needed.
+        """
+        bbox = ax.get_window_extent()
+        target_h = max(1, int(bbox.height))
+        target_w = max(1, int(bbox.width))
+        step_y = im.shape[0] // target_h if im.shape[0] > 2 * target_h else 1
+        step_x = im.shape[1] // target_w if im.shape[1] > 2 * target_w else 1
+
+        return im[::step_y, ::step_x]
+
+    @staticmethod
+    def extent(shape):
+        """The extent of a full-resolution slice, in pixel coordinates.
+
+        Given explicitly, so that downsampled slices cover the same area.
+        """
+        return (-0.5, shape[1] - 0.5, shape[0] - 0.5, -0.5)
+
+    @staticmethod
+    def to_uint8(data, vmin, vmax):
+        """Map the intensities in [vmin, vmax] linearly to [0, 255]."""
+        scale = 255.0 / (vmax - vmin) if vmax > vmin else 0.0
+
+        tmp = np.subtract(data, vmin, dtype=np.float32)
+        np.multiply(tmp, scale, out=tmp)
+        np.clip(tmp, 0.0, 255.0, out=tmp)
+        np.rint(tmp, out=tmp)
+
+        return tmp.astype(np.uint8)
 
     def clear(self,
               image_plane: typing.Union[image.ImagePlane, None] = None,
@@ -128,20 +214,10 @@ class MplCanvas(FigureCanvasQTAgg):
               ):
         """Clear axes, or a given axis."""
         if image_plane is not None:
-            if image_plane == image.ImagePlane.AXIAL:
-                self.axes[0][0].cla()
-            elif image_plane == image.ImagePlane.SAGITTAL:
-                self.axes[0][1].cla()
-            elif image_plane == image.ImagePlane.CORONAL:
-                self.axes[1][0].cla()
-            # elif index == 4:
-                # self.axes[1][1].cla()
-            else:
-                raise ValueError("Unknown image plane {image_plane}.")
+            self.plane_axes[image_plane.value].cla()
         else:
-            self.axes[0][0].cla()
-            self.axes[0][1].cla()
-            self.axes[1][0].cla()
+            for ax in self.plane_axes:
+                ax.cla()
             # self.axes[1][1].cla()
 
     def show(self):
@@ -152,117 +228,133 @@ class MplCanvas(FigureCanvasQTAgg):
     def increase_index(self,
                        change: int,
                        image_plane: image.ImagePlane,
+                       update: bool = True,
                        ):
         """Update the displayed image index."""
-        if image_plane == image.ImagePlane.AXIAL:
-            self.index_ax += change
-            self.index_ax = max(0,
-                                min(self.index_ax, self.num_slices_ax - 1))
-        elif image_plane == image.ImagePlane.SAGITTAL:
-            self.index_sag += change
-            self.index_sag = max(0,
-                                 min(self.index_sag, self.num_slices_sag - 1))
-        elif image_plane == image.ImagePlane.CORONAL:
-            self.index_cor += change
-            self.index_cor = max(0,
-                                 min(self.index_cor, self.num_slices_cor - 1))
-        else:
-            raise RuntimeError("Cannot happen!")
+        i = image_plane.value
+        self.index[i] = max(0, min(self.index[i] + change,
+                                   self.num_slices[i] - 1))
 
-        self.update_image()
+        if update:
+            self.update_image()
 
     def set_image(self, img):
         """Update the displayed image."""
         self.image = img
 
-        self.index_ax = img.shape[2] // 2
-        self.index_sag = img.shape[1] // 2
-        self.index_cor = img.shape[0] // 2
-
-        self.display_ax = None
-        self.display_sag = None
-        self.display_cor = None
-
-        self.num_slices_ax = img.shape[2]
-        self.num_slices_sag = img.shape[1]
-        self.num_slices_cor = img.shape[0]
-
-        self.min_int = img.min()
-        self.max_int = img.max()
+        # The axial, sagittal and coronal slices are along the last, middle
+        # and first axes of the image, respectively
+        self.num_slices = [img.shape[2], img.shape[1], img.shape[0]]
+        self.index = [num_slices // 2 for num_slices in self.num_slices]
+        self.display = [None, None, None]
+
+        # Map the intensities to grey levels once, so that Matplotlib does not
+        # have to normalize the slices on every draw
+        self.min_int, self.max_int = img.minmax()
+
+        # Store the slices of each plane contiguously and oriented as they are
+        # displayed, so that changing slice is only an index into these
+        shape = img.shape
+        self.stacks = [
+            np.empty((shape[2], shape[0], shape[1]), dtype=np.uint8),
+            np.empty((shape[1], shape[0], shape[2]), dtype=np.uint8),
+            np.empty((shape[0], shape[2], shape[1]), dtype=np.uint8),
+            ]
+
+        # Convert a bounded number of slices at a time, so that the image is
+        # never converted as a whole (e.g., when it is memory-mapped)
+        data = img.data
+        chunk = max(1, self.CHUNK_SIZE // max(1, shape[0] * shape[1]))
+        for start in range(0, shape[2], chunk):
+            stop = min(start + chunk, shape[2])
+            u8 = self.to_uint8(data[:, :, start:stop],
+                               self.min_int,
+                               self.max_int)
+            self.stacks[0][start:stop] = u8[::-1, :, :].transpose(2, 0, 1)
+            self.stacks[1][:, :, start:stop] = \
+                u8[::-1, :, :].transpose(1, 0, 2)
+            self.stacks[2][:, start:stop, :] = u8.transpose(0, 2, 1)
+
+        # The aspect ratios do not change while scrolling
+        self.aspects = [img.aspect_ratios(plane) for plane in self.PLANES]
 
         self.update_image()
 
     def update_image(self):
         """Draw the image."""
-        img = self.image
-
-        any_updates = False
-
-        if self.index_ax != self.display_ax:
-            self.display_ax = self.index_ax
-            im = img.get_slice(self.display_ax, image.ImagePlane.AXIAL)
-            im = im[::-1, :]
-            if self.imshow_ax is None:
-                ar = img.aspect_ratios(image.ImagePlane.AXIAL)
-                # self.clear(image.ImagePlane.AXIAL)
-                self.imshow_ax = self.axes[0][0].imshow(
-                    im,
-                    cmap=self.cmap,
-                    vmin=self.min_int,
-                    vmax=self.max_int,
-                    )
-                self.axes[0][0].invert_yaxis()
-                if ar is not None:
-                    self.axes[0][0].set_aspect(ar)
-            else:
-                self.imshow_ax.set_data(im)
-            any_updates = True
-
-        if self.index_sag != self.display_sag:
-            self.display_sag = self.index_sag
-            im = img.get_slice(self.display_sag, image.ImagePlane.SAGITTAL)
-            im = im[::-1, :]
-            if self.imshow_sag is None:
-                ar = img.aspect_ratios(image.ImagePlane.SAGITTAL)
-                # self.clear(image.ImagePlane.SAGITTAL)
-                self.imshow_sag = self.axes[0][1].imshow(
-                    im,
-                    cmap=self.cmap,
-                    vmin=self.min_int,
-                    vmax=self.max_int,
-                    )
-                self.axes[0][1].invert_yaxis()
-                if ar is not None:
-                    self.axes[0][1].set_aspect(ar)
-                # self.axes[0][1].set_xlim(self.axes[0][0].get_xlim())
-                self.axes[0][1].set_ylim(self.axes[0][0].get_ylim())
-            else:
-                self.imshow_sag.set_data(im)
-            any_updates = True
-
-        if self.index_cor != self.display_cor:
-            self.display_cor = self.index_cor
-            im = img.get_slice(self.display_cor, image.ImagePlane.CORONAL)
-            im = im.T
-            if self.imshow_cor is None:
-                ar = img.aspect_ratios(image.ImagePlane.CORONAL)
-                # self.clear(image.ImagePlane.CORONAL)
-                self.imshow_cor = self.axes[1][0].imshow(
+        full_draw = False  # New images need a full draw of the figure
+        updated = []  # Otherwise, only blit the axes with changed images
+
+        for i, plane in enumerate(self.PLANES):
+            if self.index[i] == self.display[i]:
+                continue
+
+            self.display[i] = self.index[i]
+            ax = self.plane_axes[i]
+            stack = self.stacks[i]
+            im = self.downsample(stack[self.display[i]], ax)
+            if self.imshow[i] is None:
+                self.imshow[i] = ax.imshow(
                     im,
                     cmap=self.cmap,
-                    vmin=self.min_int,
-                    vmax=self.max_int,
+                    norm=NoNorm(),  # The slices are grey levels already
+                    extent=self.extent(stack.shape[1:]),
+                    animated=True,
                     )
-                self.axes[1][0].invert_yaxis()
-                if ar is not None:
-                    self.axes[1][0].set_aspect(ar)
-                self.axes[1][0].set_xlim(self.axes[0][0].get_xlim())
+                ax.invert_yaxis()
+                if self.aspects[i] is not None:
+                    ax.set_aspect(self.aspects[i])
+
+                # Line the sagittal and coronal images up with the axial one
+                if plane == image.ImagePlane.SAGITTAL:
+                    ax.set_ylim(self.plane_axes[0].get_ylim())
+                elif plane == image.ImagePlane.CORONAL:
+                    ax.set_xlim(self.plane_axes[0].get_xlim())
+
+                full_draw = True
             else:
-                self.imshow_cor.set_data(im)
-            any_updates = True
+                self.imshow[i].set_data(im)
+                updated.append(i)
 
-        if any_updates:
+        if full_draw or (updated and self.backgrounds is None):
             self.draw()
+        else:
+            for i in updated:
+                self.restore_region(self.backgrounds[i])
+                self.plane_axes[i].draw_artist(self.imshow[i])
+                self.blit(self.plane_axes[i].bbox)
+
+
+class WorkerSignals(QtCore.QObject):
+    """Signals emitted by a background task."""
+
+    done = QtCore.Signal(object, dict)
+    failed = QtCore.Signal(str)
+
+
+class ScanTask(QtCore.QRunnable):
+    """Find all Dicom images in a directory, in a background thread."""
+
+    def __init__(self, path: pathlib.Path):
+        super().__init__()
+
+        self.path = path
+        self.signals = WorkerSignals()
+
+    def run(self):
+        """Scan the directory and emit the images found."""
+        try:
+            images = dicom.find_all_dicom_files(
+                self.path,
+                dtype=utils.settings.dtype,
+                escalation=errors.Escalation.NOTHING,
+                verbosity=utils.settings.verbosity,
+                memmap=utils.settings.memmap,
+                )
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.done.emit(self.path, images)
 
 
 class BaseEvents():
@@ -285,7 +377,20 @@ class DicomTreeTools(BaseEvents):
 
         self.fig = fig
 
+        # The items in the tree widget, looked up by their path
+        self._tree_index = dict()
+
         self.ui.selectDirectoryButton.clicked.connect(self.dir_button_clicked)
+        self.ui.treeWidget.itemDoubleClicked.connect(
+            self.tree_item_doubleclicked)
+
+        # Busy indicator, shown while a directory is scanned
+        self.progressBar = QtWidgets.QProgressBar()
+        self.progressBar.setRange(0, 0)
+        self.progressBar.setMaximumWidth(150)
+        self.progressBar.hide()
+        self.ui.statusbar.addPermanentWidget(self.progressBar)
+        self._scan_task = None
 
         self.ui.treeWidget.setHeaderLabels(["File", "Type"])
         # self.ui.treeWidget.header().setMinimumSectionSize(25)
@@ -328,29 +433,70 @@ class DicomTreeTools(BaseEvents):
 
     def tree_item_doubleclicked(self, item, column_no):
         """Event for double-clicking in tree list."""
-        if item.childCount() > 0:  # Then  it is not an image.
+        key = item.data(0, QtCore.Qt.UserRole)
+        if key is None:  # Then it is not an image.
             return
 
-        parts = []
-        while item is not None:
-            parts = [item.text(0), *parts]
-            item = item.parent()
-        path = pathlib.Path(*parts)
-        image = self.images[str(path)]
+        image = self.images[key]
 
         self.fig.set_image(image)
         # print(image)
         # TODO: Plot image...
 
+    def _add_tree_item(self, key, image_):
+        """Add a directory, or an image if given, to the tree widget."""
+        path = pathlib.Path(key)
+        if image_ is None:
+            item = QtWidgets.QTreeWidgetItem([path.name])
+        else:
+            modality = image_.modality
+            if modality is None:
+                modality = "?"
+            item = QtWidgets.QTreeWidgetItem([path.name, modality])
+            item.setData(0, QtCore.Qt.UserRole, key)  # Key in self.images
+
+        if len(path.parts) == 1:
+            self.ui.treeWidget.addTopLevelItem(item)
+        else:
+            self._tree_index[str(path.parent)].addChild(item)
+        self._tree_index[key] = item
+
     def refresh_file_tree(self, path):
-        """List all files that are Dicom files."""
+        """List all files that are Dicom files.
+
+        The directory is scanned in a background thread, and the tree is
+        updated when the scan is done.
+        """
         # print("List all files that are Dicom files." + str(path))
-        images = dicom.find_all_dicom_files(
-                    path,
-                    dtype=utils.settings.dtype,
-                    escalation=errors.Escalation.NOTHING,
-                    verbosity=utils.settings.verbosity,
-                    )
+        task = ScanTask(path)
+        task.signals.done.connect(self._on_scan_done)
+        task.signals.failed.connect(self._on_scan_failed)
+        self._scan_task = task  # Keep the signals alive until the scan ends
+
+        self.ui.selectDirectoryButton.setEnabled(False)
+        self.progressBar.show()
+        QtCore.QThreadPool.globalInstance().start(task)
+
+    def _scan_finished(self):
+        """Hide the busy indicator and allow a new scan."""
+        self._scan_task = None
+        self.progressBar.hide()
+        self.ui.selectDirectoryButton.setEnabled(True)
+
+    def _on_scan_failed(self, message):
+        """Report a failed directory scan."""
+        self._scan_finished()
+
+        msgBox = QtWidgets.QMessageBox(
+            QtWidgets.QMessageBox.Critical,
+            "Error",
+            f"Could not read the directory: {message}",
+            QtWidgets.QMessageBox.Ok)
+        msgBox.exec()
+
+    def _on_scan_done(self, path, images):
+        """Update the tree view with the images found in a directory scan."""
+        self._scan_finished()
         # print(images)
         # level = 1
         # max_level = 1
@@ -365,38 +511,37 @@ class DicomTreeTools(BaseEvents):
             self.images[str(full_path)] = images[key]
         del images
 
-        def _add_node(file, modality, parent):
-            if len(file.parts) == 1:
-                if modality is None:
-                    modality = "?"
-                child = QtWidgets.QTreeWidgetItem([str(file), modality])
-                parent.addChild(child)
-            else:
-                head, rest = file.parts[0], pathlib.Path(*file.parts[1:])
-                found = False
-                for i in range(parent.childCount()):
-                    child = parent.child(i)
-                    if child.text(0) == head:
-                        branch = child
-                        found = True
-                        break
-                if not found:
-                    branch = QtWidgets.QTreeWidgetItem([head])
-                parent.addChild(branch)
-                _add_node(rest, modality, branch)
-
-        # Add to tree widget
-        root = QtWidgets.QTreeWidgetItem([name])
+        # The keys of all directories and files that should be in the tree
+        keys = dict()
         for key in self.images:
-            # Remove root folder from key ...
-            _add_node(pathlib.Path(*pathlib.Path(key).parts[1:]),
-                      self.images[key].modality,
-                      root)
-
-        self.ui.treeWidget.insertTopLevelItems(0, [root])
-
-        self.ui.treeWidget.itemDoubleClicked.connect(
-            self.tree_item_doubleclicked)
+            parts = pathlib.Path(key).parts
+            for k in range(1, len(parts)):
+                keys.setdefault(str(pathlib.Path(*parts[:k])), None)
+            keys[key] = self.images[key]
+
+        # Only add and remove the items that changed since the last refresh
+        old = set(self._tree_index)
+        new = set(keys)
+
+        tree = self.ui.treeWidget
+        tree.setUpdatesEnabled(False)
+        tree.blockSignals(True)
+        try:
+            # Children sort after their parents, so they are removed first
+            for key in sorted(old - new, reverse=True):
+                item = self._tree_index.pop(key)
+                parent = item.parent()
+                if parent is None:
+                    tree.takeTopLevelItem(tree.indexOfTopLevelItem(item))
+                else:
+                    parent.removeChild(item)
+
+            # Parents sort before their children, so they are added first
+            for key in sorted(new - old):
+                self._add_tree_item(key, keys[key])
+        finally:
+            tree.blockSignals(False)
+            tree.setUpdatesEnabled(True)
 
         # self.ui.treeWidget.resizeColumnsToContents()
 
@@ -408,6 +553,10 @@ class MainWindow(QtWidgets.QMainWindow, Ui_MainWindow):
         super().__init__(*args, **kwargs)
         self.setupUi(self)
 
+        # Keep the images found on disk, only the displayed one is held in
+        # memory
+        utils.settings.memmap = True
+
         # TODO: Correct way? What are the units here?
         self.splitter.setSizes([100, 300])
 
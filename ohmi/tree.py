@@ -14,6 +14,7 @@ Copyright (c) 2025, Tommy Löfstedt. All rights reserved.
 import os
 import abc
 import typing
+import warnings
 import collections
 
 import errors
@@ -23,7 +24,7 @@ __all__ = ["TreePrintStyleBase", "TreePrintStyleASCII",
            "TreePrintStyleUnicode",
            "Node",
            "BaseIterator", "BFSIterator", "DFSIterator",
-           "find_all", "find_first",
+           "find_iter", "find_all", "find_first",
            ]
 
 
@@ -71,6 +72,9 @@ class TreePrintStyleUnicode(TreePrintStyleBase):
 class Node(object):
     """Create node in a tree."""
 
+    # Trees of Dicom elements can have many nodes, so avoid a dict per node
+    __slots__ = ("label", "data", "_parent", "children")
+
     def __init__(self,
                  label,  # : str,
                  data=None,  # : object,
@@ -80,13 +84,16 @@ class Node(object):
         self.label = str(label)
         self.data = data
 
-        if parent is None or isinstance(parent, Node):
-            self.parent = parent
+        self._parent = None
+        self.children = []
+
+        if parent is None:
+            pass
+        elif isinstance(parent, Node):
+            parent.add_child(self)
         else:
             raise ValueError("The `parent` must be of type `Node`.")
 
-        self.children = []
-
     @property
     def parent(self):
         """Property field parent."""
@@ -94,14 +101,50 @@ class Node(object):
 
     @parent.setter
     def parent(self, value):
-        """Setter for property field parent."""
-        if value is None or isinstance(value, Node):
-            self._parent = value
+        """Setter for property field parent.
+
+        Deprecated, use `add_child` on the new parent instead.
+        """
+        warnings.warn("Setting `Node.parent` is deprecated, use "
+                      "`Node.add_child` on the new parent instead.",
+                      DeprecationWarning,
+                      stacklevel=2)
+        if value is None:
+            self._detach()
+        elif isinstance(value, Node):
+            value.add_child(self)
         else:
             raise ValueError("The provided parent must be either `None` or "
                              "`Node`.")
+
+    def _detach(self):
+        """Remove this node from the children of its current parent."""
         if self._parent is not None:
-            self._parent.children.append(self)
+            self._parent.children.remove(self)
+            self._parent = None
+
+    def add_child(self, child):  # : Node
+        """Add a node as the last child of this node."""
+        self.add_children((child,))
+
+    def add_children(self, children):  # : typing.Iterable[Node]
+        """Add nodes as the last children of this node, in order.
+
+        All nodes are validated before any is moved, so the tree is left
+        unchanged if any of them is invalid.
+        """
+        children = list(children)
+        for child in children:
+            if not isinstance(child, Node):
+                raise ValueError("The children must be of type `Node`.")
+        if len(set(children)) != len(children):
+            raise ValueError("The same node can only be added once.")
+
+        for child in children:
+            child._detach()  # In case it is moved from another parent
+            child._parent = self
+
+        self.children.extend(children)
 
     def render(self,
                style: TreePrintStyleBase = TreePrintStyleUnicode(),
@@ -109,20 +152,34 @@ class Node(object):
                ):
         """Create a string with the entire tree."""
         _strs = [self.label]
-
-        def _print(node,  # : Node,
-                   prefix="",  # :
-                   ):
-
-            for i, child in enumerate(node.children):
-                if i < len(node.children) - 1:  # Before the last children
-                    _strs.append(prefix + style.branch + child.label)
-                    _print(child, prefix + style.vertical)
-                else:  # Last child
-                    _strs.append(prefix + style.end + child.label)
-                    _print(child, prefix + style.blank)
-
-        _print(self)  # , prefix="> ")
+        strs_append = _strs.append
+
+        # Look the style up once, instead of once per node
+        branch, vertical = style.branch, style.vertical
+        end, blank = style.end, style.blank
+
+        # Depth-first traversal with an explicit stack of (node, prefix, is
+        # last child) tuples, instead of recursion
+        stack = []
+        stack_append = stack.append
+
+        def _push_children(node, prefix):
+            # Push in reverse order, to pop the first child first
+            children = node.children
+            num_children = len(children)
+            for i in range(num_children - 1, -1, -1):
+                stack_append((children[i], prefix, i == num_children - 1))
+
+        _push_children(self, "")  # , prefix="> ")
+        while stack:
+            node, prefix, is_last = stack.pop()
+
+            if is_last:
+                strs_append(prefix + end + node.label)
+                _push_children(node, prefix + blank)
+            else:  # Before the last child
+                strs_append(prefix + branch + node.label)
+                _push_children(node, prefix + vertical)
 
         return linesep.join(_strs)
 
@@ -168,14 +225,13 @@ class BFSIterator(BaseIterator):
 
     def __iter__(self):  # : Node):
         """Create an iterator over the tree."""
-        queue = [self.node]
+        queue = collections.deque((self.node,))
         while len(queue) > 0:
-            node = queue.pop(0)  # Remove and return _first_ element from queue
+            node = queue.popleft()  # Remove and return _first_ element
 
             yield node  # Let the user process this node
 
-            for child in node.children:  # Then expand and add children
-                queue.append(child)
+            queue.extend(node.children)  # Then expand and add children
 
 
 class DFSIterator(BaseIterator):
@@ -194,8 +250,20 @@ class DFSIterator(BaseIterator):
 
             # Then expand and add children
             # Add in reverse order to start with the first one
-            for child in reversed(node.children):
-                stack.append(child)
+            stack.extend(reversed(node.children))
+
+
+def find_iter(node: Node,
+              filter_: collections.abc.Callable[[Node], bool],
+              *,
+              iterator: type[BaseIterator] = BFSIterator,
+              ):
+    """Lazily iterate over the nodes that match the `filter_`."""
+    # Call the wrapped filter directly, unless a subclass overrides __call__
+    if type(filter_) is SimpleFilter:
+        filter_ = filter_.filter_
+
+    return filter(filter_, iterator(node))
 
 
 def find_all(node: Node,
@@ -204,12 +272,7 @@ def find_all(node: Node,
              iterator: type[BaseIterator] = BFSIterator,
              ):
     """Find all nodes that match the `filter_`."""
-    nodes = []
-    for node_ in iterator(node):
-        if filter_(node_):
-            nodes.append(node_)
-
-    return nodes
+    return list(find_iter(node, filter_, iterator=iterator))
 
 
 def find_first(node: Node,
@@ -218,14 +281,14 @@ def find_first(node: Node,
                iterator: type[BaseIterator] = BFSIterator,
                ):
     """Find the first node that matches the `filter_`."""
-    for node_ in iterator(node):
-        if filter_(node_):
-            return node_
+    node_ = next(find_iter(node, filter_, iterator=iterator), None)
+    if node_ is None:
+        raise errors.NotFoundError("No node found matching the filter.")
 
-    raise errors.NotFoundError("No node found matching the filter.")
+    return node_
 
 
-class BaseFilter(collections.abc.Callable, metaclass=abc.ABCMeta):
+class BaseFilter(object):
     pass
 
 
@@ -233,7 +296,7 @@ class SimpleFilter(BaseFilter):
     def __init__(self: BaseFilter,
                  filter_: collections.abc.Callable[[Node], bool],
                  ) -> BaseFilter:
-        if isinstance(filter_, collections.Callable):
+        if callable(filter_):
             self.filter_ = filter_
         else:
             raise ValueError("The provided `filter_` must be callable.")
@@ -9,7 +9,9 @@ Copyright (c) 2025, Tommy Löfstedt. All rights reserved.
 @email:   tommy.lofstedt@umu.se
 @license: BSD 3-clause.
 """
+import os
 import typing
+import fnmatch
 import pathlib
 import dataclasses
 
@@ -29,6 +31,13 @@ class Settings(object):
 
     dtype: np.typing.DTypeLike = np.float32
     verbosity: int = 1
+    # Number of threads used when reading files
+    num_workers: int = min(32, (os.cpu_count() or 1) * 4)
+    # Back the pixel arrays of images read from disk with temporary files
+    memmap: bool = False
+    # Directory for those temporary files, the system default if None. Set it
+    # if the default (e.g., a small /tmp) cannot hold the images
+    memmap_dir: typing.Union[str, None] = None
 
     # def __init__(self,
     #              dtype: np.typing.DTypeLike = np.float32,
@@ -43,14 +52,21 @@ def find_files(path: pathlib.Path,
                patterns: typing.Union[str, list[str], tuple[str], None] = None,
                verbosity: int = 0,
                ) -> list[pathlib.Path]:
-    """Find the files matching the pattern from the given directory."""
+    """Find the files matching the pattern from the given directory.
+
+    The directory is listed once, and the names are matched against all the
+    patterns. Patterns with subdirectories (e.g., "**/*.dcm") are globbed
+    instead. A file matching several patterns is returned once, where it
+    first matched.
+    """
     if patterns is None:
         patterns = ["*"]
     elif isinstance(patterns, str):
         patterns = [patterns]
 
     # Find the files
-    files = []
+    files = dict()  # Ordered, and without duplicates
+    names = None
     utils.verbose("utils.find_files",
                   f"Reading directory '{path}'.",
                   1, verbosity)
@@ -58,13 +74,22 @@ def find_files(path: pathlib.Path,
         utils.verbose("utils.find_files",
                       f"Filtering by pattern: '{pattern}'.",
                       2, verbosity)
-        for fname in path.glob(pattern):
-            utils.verbose("utils.find_files",
-                          f"Found file: '{fname}'",
-                          3, verbosity)
-            files.append(fname)
-
-    return files
+        if "/" in pattern or os.sep in pattern:
+            found = path.glob(pattern)
+        else:
+            if names is None:
+                with os.scandir(path) as it:
+                    names = [entry.name for entry in it]
+            found = (path / name for name in fnmatch.filter(names, pattern))
+
+        for fname in found:
+            if fname not in files:
+                utils.verbose("utils.find_files",
+                              f"Found file: '{fname}'",
+                              3, verbosity)
+                files[fname] = None
+
+    return list(files)
 
 
 def verbose(who: str,
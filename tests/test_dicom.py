@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the dicom module.
+
+Copyright (c) 2025, Tommy Löfstedt. All rights reserved.
+
+@author:  Tommy Löfstedt
+@email:   tommy.lofstedt@umu.se
+@license: BSD 3-clause.
+"""
+import sys
+import pathlib
+import tempfile
+import unittest
+import warnings
+
+import numpy as np
+import pydicom
+import pydicom.uid
+from pydicom.dataset import FileDataset, FileMetaDataset
+
+# The package uses flat imports, e.g. `import errors`
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / "ohmi"))
+
+import dicom  # noqa: E402
+import errors  # noqa: E402
+
+
+def write_slice(file,
+                series_uid,
+                slice_location,
+                pixels,
+                pixel_spacing=(0.5, 0.5),
+                slice_thickness=2.0,
+                modality="CT",
+                slope=1.0,
+                intercept=0.0,
+                ):
+    """Write a minimal Dicom file with a single int16 slice."""
+    file_meta = FileMetaDataset()
+    file_meta.MediaStorageSOPClassUID = pydicom.uid.CTImageStorage
+    file_meta.MediaStorageSOPInstanceUID = pydicom.uid.generate_uid()
+    file_meta.TransferSyntaxUID = pydicom.uid.ExplicitVRLittleEndian
+
+    ds = FileDataset(str(file), {}, file_meta=file_meta,
+                     preamble=b"\0" * 128)
+    ds.SOPClassUID = file_meta.MediaStorageSOPClassUID
+    ds.SOPInstanceUID = file_meta.MediaStorageSOPInstanceUID
+    ds.SeriesInstanceUID = series_uid
+    ds.Modality = modality
+    ds.SliceLocation = slice_location
+    ds.SliceThickness = slice_thickness
+    ds.PixelSpacing = list(pixel_spacing)
+    ds.RescaleSlope = slope
+    ds.RescaleIntercept = intercept
+
+    pixels = np.asarray(pixels, dtype=np.int16)
+    ds.Rows, ds.Columns = pixels.shape
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = "MONOCHROME2"
+    ds.BitsAllocated = 16
+    ds.BitsStored = 16
+    ds.HighBit = 15
+    ds.PixelRepresentation = 1
+    ds.PixelData = pixels.tobytes()
+
+    ds.save_as(file)
+
+
+class TestReadDirectory(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self._tmp.name)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def read(self, **kwargs):
+        kwargs.setdefault("escalation", errors.Escalation.NOTHING)
+        return dicom.read_directory(self.path, verbosity=0, num_workers=2,
+                                    **kwargs)
+
+    def test_slices_sorted_by_slice_location(self):
+        uid = pydicom.uid.generate_uid()
+        # Written out of order, and with file names in yet another order
+        for name, location in [("a", 2.0), ("b", -1.0), ("c", 0.5)]:
+            write_slice(self.path / f"{name}.dcm", uid, location,
+                        np.full((4, 4), location * 10))
+
+        images = self.read()
+
+        self.assertEqual(list(images), [uid])
+        data = images[uid].data
+        self.assertEqual(data.shape, (4, 4, 3))
+        np.testing.assert_array_equal(data[0, 0, :], [-10.0, 5.0, 20.0])
+
+    def test_inconsistent_series_is_dropped(self):
+        good = pydicom.uid.generate_uid()
+        bad = pydicom.uid.generate_uid()
+        for i in range(3):
+            write_slice(self.path / f"good{i}.dcm", good, float(i),
+                        np.zeros((4, 4)))
+            write_slice(self.path / f"bad{i}.dcm", bad, float(i),
+                        np.zeros((4, 4)),
+                        pixel_spacing=(0.5, 0.5) if i != 1 else (0.7, 0.7))
+
+        images = self.read()
+        self.assertEqual(list(images), [good])
+
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter("always")
+            images = self.read(escalation=errors.Escalation.WARNING)
+        self.assertEqual(list(images), [good])
+        self.assertTrue(any("spacings" in str(w_.message) for w_ in w))
+
+    def test_non_dicom_files_are_skipped(self):
+        uid = pydicom.uid.generate_uid()
+        write_slice(self.path / "s0.dcm", uid, 0.0, np.ones((4, 4)))
+        (self.path / "notes.txt").write_text("not dicom")
+        (self.path / "empty.dcm").write_bytes(b"")
+
+        images = self.read()
+
+        self.assertEqual(list(images), [uid])
+        self.assertEqual(images[uid].shape, (4, 4, 1))
+
+    def test_rescale(self):
+        uid = pydicom.uid.generate_uid()
+        pixels = np.arange(16).reshape(4, 4)
+        for i in range(2):
+            write_slice(self.path / f"s{i}.dcm", uid, float(i), pixels,
+                        slope=2.0, intercept=-1024.0)
+
+        rescaled = self.read()[uid].data
+        raw = self.read(rescale=False)[uid].data
+
+        for i in range(2):
+            np.testing.assert_array_equal(rescaled[:, :, i],
+                                          pixels * 2.0 - 1024.0)
+            np.testing.assert_array_equal(raw[:, :, i], pixels)
+
+    def test_non_square_slices(self):
+        uid = pydicom.uid.generate_uid()
+        pixels = np.arange(3 * 5).reshape(3, 5)  # Rows x Columns
+        for i in range(2):
+            write_slice(self.path / f"s{i}.dcm", uid, float(i), pixels + i)
+
+        img = self.read()[uid]
+
+        self.assertEqual(img.shape, (3, 5, 2))
+        np.testing.assert_array_equal(img.data[:, :, 1], pixels + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
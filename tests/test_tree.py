@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the tree module.
+
+Copyright (c) 2025, Tommy Löfstedt. All rights reserved.
+
+@author:  Tommy Löfstedt
+@email:   tommy.lofstedt@umu.se
+@license: BSD 3-clause.
+"""
+import sys
+import pathlib
+import unittest
+
+# The package uses flat imports, e.g. `import errors`
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / "ohmi"))
+
+import tree  # noqa: E402
+
+
+class TestAddChildren(unittest.TestCase):
+
+    def test_invalid_child_leaves_tree_unchanged(self):
+        p = tree.Node("p")
+        q = tree.Node("q")
+        c1 = tree.Node("c1", parent=p)
+        c2 = tree.Node("c2", parent=p)
+
+        with self.assertRaises(ValueError):
+            q.add_children([c2, "x"])
+
+        self.assertIs(c2.parent, p)
+        self.assertEqual(p.children, [c1, c2])
+        self.assertEqual(q.children, [])
+
+    def test_duplicate_child_leaves_tree_unchanged(self):
+        p = tree.Node("p")
+        q = tree.Node("q")
+        c = tree.Node("c", parent=q)
+
+        with self.assertRaises(ValueError):
+            p.add_children([c, c])
+
+        self.assertIs(c.parent, q)
+        self.assertEqual(q.children, [c])
+        self.assertEqual(p.children, [])
+
+    def test_move_child(self):
+        p = tree.Node("p")
+        q = tree.Node("q")
+        c1 = tree.Node("c1", parent=p)
+        c2 = tree.Node("c2", parent=p)
+
+        q.add_children([c2, c1])
+
+        self.assertEqual(p.children, [])
+        self.assertEqual(q.children, [c2, c1])
+        self.assertIs(c1.parent, q)
+        self.assertIs(c2.parent, q)
+
+
+if __name__ == "__main__":
+    unittest.main()